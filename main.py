@@ -11,25 +11,64 @@ import os
 import sys
 import csv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import subprocess
 import shutil
 import logging
 import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
 from tqdm import tqdm
+import aiohttp
+
+from replace_resname import replace_resname_in_mol2_inplace
 import pandas as pd
 import numpy as np
 
+# PubChem结构下载地址
+PUBCHEM_SDF_3D_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/SDF?record_type=3d"
+PUBCHEM_SDF_2D_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/SDF"
+
+# PubChem请求限速（官方上限为每秒5次）与重试策略（同步会话和异步预下载共用）
+PUBCHEM_MAX_REQUESTS_PER_SECOND = 5
+HTTP_RETRY_TOTAL = 3
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class AsyncRateLimiter:
+    """异步请求限速器：相邻请求的发出间隔不小于 1/rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        """等待到允许发出下一个请求的时间"""
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            if self.next_time > now:
+                await asyncio.sleep(self.next_time - now)
+                now = self.next_time
+            self.next_time = now + self.interval
+
 
 class GromacsProcessor:
     """GROMACS模拟文件自动处理器"""
 
-    def __init__(self, mol_csv_path="Mol.csv", file_dir="File", log_level=logging.INFO):
+    def __init__(self, mol_csv_path="Mol.csv", file_dir="File", log_level=logging.INFO, max_workers=None):
         """初始化处理器"""
         self.mol_csv_path = mol_csv_path
         self.file_dir = file_dir
         self.base_dir = Path(".")
+        self.log_level = log_level
+        # 每个样本会同时运行两个obabel/acpype进程，默认进程数取CPU核心数的一半以免超额占用
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 1) // 2)
 
         # 样本数据
         self.samples = []
@@ -42,6 +81,21 @@ class GromacsProcessor:
             'skipped': 0
         }
 
+        # HTTP会话（按进程懒加载，见 session 属性）
+        self._session = None
+        self._session_pid = None
+
+        # 模板文件列表（只扫描一次）
+        template_dir = Path(self.file_dir)
+        if template_dir.is_dir():
+            self._template_files = [p for p in template_dir.iterdir() if p.is_file()]
+        else:
+            self._template_files = None
+
+        # PubChem结构缓存目录（按CID缓存，跨运行复用）
+        self.cache_dir = self.base_dir / ".pubchem_cache"
+        self.cache_dir.mkdir(exist_ok=True)
+
         # 创建日志目录
         self.log_dir = Path("logs")
         self.log_dir.mkdir(exist_ok=True)
@@ -52,17 +106,28 @@ class GromacsProcessor:
         # 检查依赖
         self.check_dependencies()
 
+        # 解析acpype路径（避免每次调用都经过conda run）
+        self.resolve_acpype()
+
     def setup_logging(self, level):
         """设置日志系统"""
         log_file = self.log_dir / f"gromacs_processor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+
+        # 文件日志先缓存在内存中批量写入，遇到ERROR立即落盘
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(log_format))
+
+        self.log_handlers = [
+            MemoryHandler(1000, flushLevel=logging.ERROR, target=file_handler),
+            logging.StreamHandler(sys.stdout)
+        ]
+
         logging.basicConfig(
             level=level,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
-            ]
+            format=log_format,
+            handlers=self.log_handlers
         )
 
         self.logger = logging.getLogger(__name__)
@@ -89,16 +154,71 @@ class GromacsProcessor:
         else:
             self.logger.info("所有依赖工具检查通过")
 
+    def resolve_acpype(self):
+        """获取gcc环境激活后的环境变量并定位其中的acpype可执行文件"""
+        self._acpype_bin = None
+        self._acpype_env = None
+
+        try:
+            # 与 conda run 相同的激活流程（含 activate.d 脚本设置的 AMBERHOME 等变量）只执行一次
+            cmd = ["conda", "run", "-n", "gcc", "env", "-0"]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+
+            if result.returncode == 0:
+                env = {}
+                for entry in result.stdout.split('\0'):
+                    key, sep, value = entry.lstrip('\n').partition('=')
+                    if sep and key:
+                        env[key] = value
+
+                acpype_bin = shutil.which("acpype", path=env.get("PATH"))
+                if acpype_bin:
+                    self._acpype_bin = acpype_bin
+                    self._acpype_env = env
+                    self.logger.info(f"acpype路径：{self._acpype_bin}")
+                    return
+        except Exception as e:
+            self.logger.warning(f"解析acpype路径出错：{e}")
+
+        self.logger.warning("未能解析gcc环境中的acpype路径，将使用 conda run 调用")
+
+    def __getstate__(self):
+        """序列化时去掉日志处理器（子进程通过队列写日志）"""
+        state = self.__dict__.copy()
+        state.pop('log_handlers', None)
+        state['_session'] = None
+        state['_session_pid'] = None
+        return state
+
+    @property
+    def session(self):
+        """当前进程的HTTP会话（复用连接池并自动重试）"""
+        if self._session is None or self._session_pid != os.getpid():
+            retries = Retry(total=HTTP_RETRY_TOTAL, backoff_factor=HTTP_RETRY_BACKOFF,
+                            status_forcelist=list(HTTP_RETRY_STATUSES))
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retries)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+
+            self._session = session
+            self._session_pid = os.getpid()
+
+        return self._session
+
     def read_mol_csv(self):
         """读取Mol.csv文件并验证数据"""
         self.logger.info("读取Mol.csv文件...")
 
         try:
-            # 尝试不同的编码方式读取CSV
+            # utf-8-sig 同时兼容带BOM和不带BOM的UTF-8文件
             try:
-                df = pd.read_csv(self.mol_csv_path, encoding='utf-8-sig')
-            except UnicodeDecodeError:
-                df = pd.read_csv(self.mol_csv_path, encoding='utf-8')
+                # 优先使用pyarrow引擎解析
+                df = pd.read_csv(self.mol_csv_path, encoding='utf-8-sig', engine='pyarrow')
+            except (ImportError, pd.errors.ParserError):
+                # 未安装pyarrow或存在列数不足的行（pyarrow引擎不接受）时使用C引擎，
+                # 缺失的单元格补为NaN，在下面的数据校验中跳过；多出字段的行仍然报错
+                df = pd.read_csv(self.mol_csv_path, encoding='utf-8-sig', engine='c')
 
             self.logger.info(f"读取到 {len(df)} 个样本数据")
 
@@ -131,26 +251,26 @@ class GromacsProcessor:
                     self.logger.error(error_msg)
                     raise ValueError(error_msg)
 
-            # 检查数据完整性
-            valid_samples = []
-            for idx, row in df.iterrows():
-                sample_id = row['sample']
-                cid_a = row['CID_A']
-                cid_b = row['CID_B']
+            # 检查数据完整性（向量化校验：缺失值或非数值的行被丢弃）
+            before_count = len(df)
+
+            df = df[required_columns].copy()
+            for col in required_columns:
+                # 已是数值类型（任意整数/浮点宽度）的列无需转换，其余列非数值项转为NaN
+                # 转为numpy float64，确保非数值项是 dropna 能识别的缺失值
+                if not pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
 
-                if pd.isna(sample_id) or pd.isna(cid_a) or pd.isna(cid_b):
-                    self.logger.warning(f"第 {idx+2} 行数据不完整，跳过")
-                    continue
+            df = df.dropna(subset=required_columns)
+            # ±inf（如 "inf"、"1e400"）无法转为整数，同样视为格式错误
+            df = df[np.isfinite(df[required_columns]).all(axis=1)]
+            df = df.astype({col: 'int64' for col in required_columns})
 
-                if not isinstance(cid_a, (int, float, np.int64)) or not isinstance(cid_b, (int, float, np.int64)):
-                    self.logger.warning(f"第 {idx+2} 行CID格式错误：CID_A={cid_a} (type: {type(cid_a)}), CID_B={cid_b} (type: {type(cid_b)})")
-                    continue
+            dropped_count = before_count - len(df)
+            if dropped_count:
+                self.logger.warning(f"{dropped_count} 行数据不完整或CID格式错误，已跳过")
 
-                valid_samples.append({
-                    'Sample': int(sample_id),
-                    'CID_A': int(cid_a),
-                    'CID_B': int(cid_b)
-                })
+            valid_samples = df.rename(columns={'sample': 'Sample'}).to_dict('records')
 
             self.logger.info(f"有效样本数据：{valid_samples}")
 
@@ -166,116 +286,241 @@ class GromacsProcessor:
         """检查已完成的样本"""
         self.logger.info("检查已完成的样本...")
 
+        # 一次扫描得到已存在的样本目录，避免逐个 stat
+        existing_dirs = {entry.name for entry in os.scandir(self.base_dir) if entry.is_dir()}
+        key_files = {'MOA_GMX.gro', 'MOA_GMX.itp', 'MOB_GMX.gro', 'MOB_GMX.itp'}
+
         completed_count = 0
         for sample in self.samples:
-            sample_dir = self.base_dir / str(sample['Sample'])
-            if sample_dir.exists():
-                # 检查关键文件是否存在
-                key_files = [
-                    sample_dir / 'MOA_GMX.gro',
-                    sample_dir / 'MOA_GMX.itp',
-                    sample_dir / 'MOB_GMX.gro',
-                    sample_dir / 'MOB_GMX.itp'
-                ]
-
-                if all(f.exists() for f in key_files):
-                    self.completed_samples.append(sample['Sample'])
-                    completed_count += 1
-                    continue
+            sample_name = str(sample['Sample'])
+            if sample_name not in existing_dirs:
+                continue
+
+            # 检查关键文件是否存在
+            file_names = {entry.name for entry in os.scandir(self.base_dir / sample_name)}
+            if key_files <= file_names:
+                self.completed_samples.append(sample['Sample'])
+                completed_count += 1
 
         self.stats['skipped'] = completed_count
         self.logger.info(f"已跳过 {completed_count} 个已完成样本")
 
+    def get_cache_path(self, cid, is_2d=False):
+        """CID对应的本地缓存SDF路径（2D结构单独存放，不占用3D结构的缓存位置）"""
+        if is_2d:
+            return self.cache_dir / f"{cid}_2d.sdf"
+        return self.cache_dir / f"{cid}.sdf"
+
+    def find_cached_structure(self, cid):
+        """返回CID已缓存的结构路径（优先3D），未缓存时返回None"""
+        for is_2d in (False, True):
+            cache_path = self.get_cache_path(cid, is_2d)
+            if cache_path.exists():
+                return cache_path
+        return None
+
+    def save_to_cache(self, cid, content, is_2d=False):
+        """写入缓存（先写临时文件再原子替换，避免并发读到半个文件）"""
+        cache_path = self.get_cache_path(cid, is_2d)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+
+    def link_or_copy(self, src_path, dst_path):
+        """硬链接文件（跨文件系统等无法链接时改为复制）"""
+        dst_path = Path(dst_path)
+
+        if dst_path.exists():
+            dst_path.unlink()
+
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copy2(src_path, dst_path)
+
+    def link_cached_structure(self, cid, output_path):
+        """把缓存中的SDF链接到样本目录"""
+        self.link_or_copy(self.find_cached_structure(cid), output_path)
+
     def download_pubchem_structure(self, cid, output_path, sample_dir):
-        """从PubChem下载分子结构"""
+        """从PubChem下载分子结构（优先使用本地缓存）"""
+        if self.find_cached_structure(cid):
+            self.link_cached_structure(cid, output_path)
+            self.logger.info(f"使用缓存的 CID {cid} 结构：{output_path}")
+            return True
+
         self.logger.info(f"下载 CID {cid} 的结构...")
 
-        # 尝试下载3D结构
-        url_3d = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/SDF?record_type=3d"
+        # 尝试下载3D结构（限流和服务端错误由会话自动重试）
+        url_3d = PUBCHEM_SDF_3D_URL.format(cid=cid)
 
         try:
-            response = requests.get(url_3d, timeout=30)
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                self.logger.info(f"成功下载3D结构：{output_path}")
-                return True
+            response = self.session.get(url_3d, timeout=(5, 30))
         except Exception as e:
-            self.logger.warning(f"3D结构下载失败：{e}")
+            self.logger.error(f"3D结构下载失败：{e}")
+            return False
+
+        if response.status_code == 200:
+            self.save_to_cache(cid, response.content)
+            self.link_cached_structure(cid, output_path)
+            self.logger.info(f"成功下载3D结构：{output_path}")
+            return True
 
-        # 如果3D失败，尝试下载2D结构
-        url_2d = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{cid}/SDF"
+        # 只有PubChem确实没有3D结构（404）时才回退到2D，其他错误不回退
+        if response.status_code != 404:
+            self.logger.error(f"3D结构下载失败：HTTP {response.status_code}")
+            return False
+
+        self.logger.warning(f"CID {cid} 没有3D结构，尝试下载2D结构")
+        url_2d = PUBCHEM_SDF_2D_URL.format(cid=cid)
 
         try:
-            response = requests.get(url_2d, timeout=30)
+            response = self.session.get(url_2d, timeout=(5, 30))
             if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
+                self.save_to_cache(cid, response.content, is_2d=True)
+                self.link_cached_structure(cid, output_path)
                 self.logger.info(f"成功下载2D结构：{output_path}")
                 return True
+            self.logger.error(f"2D结构下载失败：HTTP {response.status_code}")
         except Exception as e:
             self.logger.error(f"2D结构下载失败：{e}")
 
         return False
 
-    def convert_sdf_to_mol2(self, sdf_path, mol2_path):
-        """转换SDF格式到MOL2格式"""
-        self.logger.info(f"转换 {sdf_path} 到 MOL2 格式...")
+    async def _fetch_url(self, http, limiter, url):
+        """限速请求URL，限流或服务端错误时退避重试，返回 (状态码, 内容)"""
+        status = None
+        for attempt in range(HTTP_RETRY_TOTAL + 1):
+            await limiter.wait()
+            retry_after = 0.0
 
-        try:
-            cmd = f"obabel {sdf_path} -O {mol2_path}"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=60)
+            try:
+                async with http.get(url) as response:
+                    status = response.status
+                    if status == 200:
+                        return status, await response.read()
+                    if status not in HTTP_RETRY_STATUSES:
+                        return status, None
+                    header = response.headers.get('Retry-After', '')
+                    retry_after = float(header) if header.isdigit() else 0.0
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = None
+                self.logger.debug(f"请求 {url} 出错：{e}")
+
+            if attempt < HTTP_RETRY_TOTAL:
+                await asyncio.sleep(max(HTTP_RETRY_BACKOFF * (2 ** attempt), retry_after))
+
+        return status, None
+
+    async def _fetch_structure(self, http, semaphore, limiter, cid):
+        """异步下载单个分子结构到缓存（优先3D，仅在没有3D结构时回退2D）"""
+        async with semaphore:
+            for label, url_template, is_2d in (("3D", PUBCHEM_SDF_3D_URL, False), ("2D", PUBCHEM_SDF_2D_URL, True)):
+                status, content = await self._fetch_url(http, limiter, url_template.format(cid=cid))
+
+                if status == 200:
+                    self.save_to_cache(cid, content, is_2d)
+                    self.logger.info(f"成功下载 CID {cid} 的{label}结构")
+                    return True
+
+                self.logger.warning(f"CID {cid} 的{label}结构下载失败：{f'HTTP {status}' if status else '连接错误'}")
+                if status != 404:
+                    return False
 
-            if result.returncode != 0:
-                self.logger.error(f"SDF转MOL2失败：{result.stderr}")
-                return False
+        return False
 
-            # 删除SDF文件
-            os.remove(sdf_path)
-            self.logger.info(f"成功转换并删除SDF文件：{mol2_path}")
-            return True
+    async def _download_all(self, cid_list):
+        """并发下载 cid_list 中的所有分子结构到缓存"""
+        connector = aiohttp.TCPConnector(limit=32)
+        timeout = aiohttp.ClientTimeout(total=30)
+        semaphore = asyncio.Semaphore(16)
+        limiter = AsyncRateLimiter(PUBCHEM_MAX_REQUESTS_PER_SECOND)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            return await asyncio.gather(*(
+                self._fetch_structure(http, semaphore, limiter, cid)
+                for cid in cid_list
+            ))
+
+    def prefetch_structures(self, samples):
+        """批量预下载待处理样本的SDF文件（每个CID最多下载一次）"""
+        # 去重并跳过已缓存的CID
+        all_cids = dict.fromkeys(
+            cid for sample in samples for cid in (sample['CID_A'], sample['CID_B'])
+        )
+        cid_list = [cid for cid in all_cids if self.find_cached_structure(cid) is None]
 
-        except Exception as e:
-            self.logger.error(f"转换过程中出现错误：{e}")
-            return False
+        if cid_list:
+            self.logger.info(f"并发预下载 {len(cid_list)} 个分子结构...")
+
+            try:
+                results = asyncio.run(self._download_all(cid_list))
+            except Exception as e:
+                self.logger.warning(f"批量预下载失败，将在样本处理时逐个下载：{e}")
+                return
+
+            failed_count = results.count(False)
+            if failed_count:
+                self.logger.warning(f"{failed_count} 个分子结构预下载失败，将在样本处理时重试")
+            else:
+                self.logger.info("所有分子结构预下载完成")
+
+        # 从缓存链接到各样本目录
+        for sample in samples:
+            sample_dir = Path(str(sample['Sample']))
+            sample_dir.mkdir(exist_ok=True)
+            for cid, name in ((sample['CID_A'], "MOA.sdf"), (sample['CID_B'], "MOB.sdf")):
+                if self.find_cached_structure(cid):
+                    self.link_cached_structure(cid, sample_dir / name)
+
+    def is_2d_structure(self, sdf_path):
+        """根据SDF头部的维度标记判断是否为2D结构"""
+        with open(sdf_path, 'r') as f:
+            f.readline()
+            header = f.readline()
+        return header[20:22] == "2D"
 
-    def optimize_molecule_geometry(self, mol2_path, force_field="MMFF94"):
-        """优化分子几何结构"""
-        self.logger.info(f"优化分子几何结构：{mol2_path}")
+    def convert_sdf_to_mol2(self, sdf_path, mol2_path, force_field="MMFF94"):
+        """转换SDF格式到MOL2格式并同时优化分子几何结构"""
+        self.logger.info(f"转换 {sdf_path} 到 MOL2 格式并优化几何结构...")
 
         try:
-            # 使用Open Babel进行几何优化
-            cmd = f"obabel {mol2_path} -O {mol2_path} --minimize --ff {force_field} --steps 1000 --dielectric 78.0"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=120)
+            # 一次obabel调用完成格式转换和几何优化
+            cmd = [
+                "obabel", str(sdf_path), "-O", str(mol2_path),
+                "--minimize", "--ff", force_field, "--steps", "1000", "--dielectric", "78.0"
+            ]
+
+            # 2D结构需要先生成3D坐标
+            if self.is_2d_structure(sdf_path):
+                cmd.append("--gen3d")
+
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
 
             if result.returncode != 0:
-                self.logger.error(f"几何优化失败：{result.stderr}")
+                self.logger.error(f"SDF转MOL2及几何优化失败：{result.stderr}")
                 return False
 
-            self.logger.info(f"成功优化分子几何结构：{mol2_path}")
+            # 删除SDF文件
+            os.remove(sdf_path)
+            self.logger.info(f"成功转换、优化并删除SDF文件：{mol2_path}")
             return True
 
         except Exception as e:
-            self.logger.error(f"几何优化过程中出现错误：{e}")
+            self.logger.error(f"转换过程中出现错误：{e}")
             return False
 
     def run_replace_resname(self, sample_dir):
-        """运行残基重命名脚本"""
-        self.logger.info(f"运行残基重命名脚本：{sample_dir}")
+        """残基重命名（在进程内调用 replace_resname 模块）"""
+        self.logger.info(f"运行残基重命名：{sample_dir}")
 
         try:
-            # 切换到工作目录
-            original_dir = os.getcwd()
-            os.chdir(self.base_dir)
-
-            cmd = f"python replace_resname.py {sample_dir}"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=60)
+            # 只处理当前样本目录中的 mol2 文件
+            for mol2_path in Path(sample_dir).glob("*.mol2"):
+                base_name = replace_resname_in_mol2_inplace(str(mol2_path))
+                self.logger.info(f"修改完成：{mol2_path} （残基名改为 {base_name}）")
 
-            if result.returncode != 0:
-                self.logger.error(f"残基重命名失败：{result.stderr}")
-                return False
-
-            os.chdir(original_dir)
             self.logger.info("成功完成残基重命名")
             return True
 
@@ -288,16 +533,24 @@ class GromacsProcessor:
         self.logger.info(f"生成AMBER拓扑：{mol2_path}")
 
         try:
-            # 切换到样本目录
-            original_dir = os.getcwd()
+            # 在样本目录中运行（不切换进程的当前目录）
             mol_dir = mol2_path.parent
-            os.chdir(mol_dir)
 
-            # 激活conda环境（使用conda run命令）
-            cmd = f"conda run -n gcc acpype -i {mol2_path.name} -c bcc -a gaff2 -n {charge} -b {basename}"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=3600)
+            acpype_args = [
+                "-i", mol2_path.name, "-c", "bcc", "-a", "gaff2",
+                "-n", str(charge), "-b", basename
+            ]
 
-            os.chdir(original_dir)
+            if self._acpype_bin:
+                # 直接调用gcc环境中的acpype，使用该环境激活后的完整环境变量
+                cmd = [self._acpype_bin] + acpype_args
+                env = self._acpype_env
+            else:
+                # 回退：激活conda环境（使用conda run命令）
+                cmd = ["conda", "run", "-n", "gcc", "acpype"] + acpype_args
+                env = None
+
+            result = subprocess.run(cmd, cwd=str(mol_dir), env=env, capture_output=True, text=True, timeout=3600)
 
             if result.returncode != 0:
                 self.logger.error(f"AMBER拓扑生成失败：{result.stderr}")
@@ -314,45 +567,47 @@ class GromacsProcessor:
         """提取原子类型参数（剪切功能）"""
         self.logger.info(f"提取原子类型参数：{itp_file}")
 
-        try:
-            with open(itp_file, 'r') as f:
-                lines = f.readlines()
+        itp_file = Path(itp_file)
+        output_file = Path(output_file)
+        itp_tmp = itp_file.with_name(itp_file.name + ".tmp")
+        prm_tmp = output_file.with_name(output_file.name + ".tmp")
 
-            # 读取原文件内容
-            original_content = lines.copy()
-
-            # 提取 atomtypes 段
-            atomtypes_content = []
+        try:
+            # 单次流式读取，同时写出 atomtypes 段和剩余内容
             in_atomtypes = False
-            atomtypes_start = -1
-            atomtypes_end = -1
-
-            for i, line in enumerate(lines):
-                if line.strip() == '[ atomtypes ]':
-                    in_atomtypes = True
-                    atomtypes_start = i
-                    atomtypes_content.append(line)
-                elif in_atomtypes:
-                    if line.strip() == '':  # 空行表示段落结束
-                        atomtypes_end = i + 1
-                        break
-                    atomtypes_content.append(line)
-
-            # 如果找到 atomtypes 段，写入输出文件并从原文件删除
-            if atomtypes_start >= 0 and atomtypes_end >= 0:
-                # 写入输出文件
-                with open(output_file, 'w') as f:
-                    f.writelines(atomtypes_content)
-
-                # 从原文件中删除 atomtypes 段
-                new_content = lines[:atomtypes_start] + lines[atomtypes_end:]
-
-                # 重写原文件（删除 atomtypes 段）
-                with open(itp_file, 'w') as f:
-                    f.writelines(new_content)
+            atomtypes_found = False
+            atomtypes_done = False
+            removed_lines = 0
+
+            with open(itp_file, 'r', buffering=1 << 20) as f_in, \
+                    open(itp_tmp, 'w', buffering=1 << 20) as f_itp, \
+                    open(prm_tmp, 'w', buffering=1 << 20) as f_prm:
+                for line in f_in:
+                    if atomtypes_done:
+                        f_itp.write(line)
+                    elif line.strip() == '[ atomtypes ]':
+                        in_atomtypes = True
+                        atomtypes_found = True
+                        f_prm.write(line)
+                        removed_lines += 1
+                    elif in_atomtypes:
+                        removed_lines += 1
+                        if line.strip() == '':  # 空行表示段落结束
+                            in_atomtypes = False
+                            atomtypes_done = True
+                        else:
+                            f_prm.write(line)
+                    else:
+                        f_itp.write(line)
+
+            # 如果找到 atomtypes 段，替换输出文件和原文件（删除 atomtypes 段）
+            if atomtypes_found and atomtypes_done:
+                # 先写出参数文件，再替换原文件，避免替换中途失败时丢失 atomtypes 段
+                os.replace(prm_tmp, output_file)
+                os.replace(itp_tmp, itp_file)
 
                 self.logger.info(f"成功提取并剪切原子类型参数：{output_file}")
-                self.logger.info(f"从 {itp_file} 中删除了 {atomtypes_end - atomtypes_start} 行")
+                self.logger.info(f"从 {itp_file} 中删除了 {removed_lines} 行")
                 return True
             else:
                 self.logger.warning(f"在 {itp_file} 中未找到 [ atomtypes ] 段")
@@ -362,18 +617,25 @@ class GromacsProcessor:
             self.logger.error(f"提取原子类型参数失败：{e}")
             return False
 
+        finally:
+            # 清理未被替换的临时文件
+            for tmp_path in (itp_tmp, prm_tmp):
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
     def copy_template_files(self, sample_dir):
         """复制模板文件"""
         self.logger.info(f"复制模板文件到：{sample_dir}")
 
         try:
-            template_dir = Path(self.file_dir)
+            if self._template_files is None:
+                raise FileNotFoundError(f"模板目录不存在：{self.file_dir}")
+
             target_dir = Path(sample_dir)
 
-            # 复制所有文件
-            for file_path in template_dir.iterdir():
-                if file_path.is_file():
-                    shutil.copy2(file_path, target_dir / file_path.name)
+            # 复制所有文件（每个样本持有独立副本，修改模板不会影响已生成的样本）
+            for file_path in self._template_files:
+                shutil.copy2(file_path, target_dir / file_path.name)
 
             self.logger.info("成功复制模板文件")
             return True
@@ -382,8 +644,14 @@ class GromacsProcessor:
             self.logger.error(f"复制模板文件失败：{e}")
             return False
 
-    def process_single_sample(self, sample_data, progress_bar):
-        """处理单个样本"""
+    def run_in_parallel(self, *calls):
+        """并行执行相互独立的步骤 (func, *args)，按提交顺序返回结果"""
+        with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            futures = [executor.submit(func, *args) for func, *args in calls]
+            return [future.result() for future in futures]
+
+    def process_single_sample(self, sample_data):
+        """处理单个样本，返回处理结果（在工作进程中执行）"""
         sample_id = sample_data['Sample']
         cid_a = sample_data['CID_A']
         cid_b = sample_data['CID_B']
@@ -396,42 +664,45 @@ class GromacsProcessor:
             sample_dir = Path(str(sample_id))
             sample_dir.mkdir(exist_ok=True)
 
-            # 步骤1：下载分子A结构
+            # 步骤1：下载分子A结构（已预下载时直接从缓存链接）
             moa_sdf = sample_dir / "MOA.sdf"
             if not self.download_pubchem_structure(cid_a, moa_sdf, sample_dir):
                 raise RuntimeError(f"无法下载分子A结构 (CID: {cid_a})")
 
-            # 步骤2：下载分子B结构
+            # 步骤2：下载分子B结构（已预下载时直接从缓存链接）
             mob_sdf = sample_dir / "MOB.sdf"
             if not self.download_pubchem_structure(cid_b, mob_sdf, sample_dir):
                 raise RuntimeError(f"无法下载分子B结构 (CID: {cid_b})")
 
-            # 步骤3：格式转换
+            # 步骤3-4：格式转换与分子几何优化（两个分子相互独立，并行运行）
             moa_mol2 = sample_dir / "MOA.mol2"
             mob_mol2 = sample_dir / "MOB.mol2"
 
-            if not self.convert_sdf_to_mol2(moa_sdf, moa_mol2):
-                raise RuntimeError("分子A格式转换失败")
-
-            if not self.convert_sdf_to_mol2(mob_sdf, mob_mol2):
-                raise RuntimeError("分子B格式转换失败")
+            moa_success, mob_success = self.run_in_parallel(
+                (self.convert_sdf_to_mol2, moa_sdf, moa_mol2),
+                (self.convert_sdf_to_mol2, mob_sdf, mob_mol2)
+            )
 
-            # 步骤4：分子几何优化
-            if not self.optimize_molecule_geometry(moa_mol2):
-                raise RuntimeError("分子A几何优化失败")
+            if not moa_success:
+                raise RuntimeError("分子A格式转换或几何优化失败")
 
-            if not self.optimize_molecule_geometry(mob_mol2):
-                raise RuntimeError("分子B几何优化失败")
+            if not mob_success:
+                raise RuntimeError("分子B格式转换或几何优化失败")
 
             # 步骤5：残基名称标准化
             if not self.run_replace_resname(str(sample_dir)):
                 raise RuntimeError("残基名称标准化失败")
 
-            # 步骤6：AMBER拓扑生成
-            if not self.generate_amber_topology(moa_mol2, "MOA", 0):
+            # 步骤6：AMBER拓扑生成（两个分子相互独立，并行运行）
+            moa_success, mob_success = self.run_in_parallel(
+                (self.generate_amber_topology, moa_mol2, "MOA", 0),
+                (self.generate_amber_topology, mob_mol2, "MOB", 0)
+            )
+
+            if not moa_success:
                 raise RuntimeError("分子A拓扑生成失败")
 
-            if not self.generate_amber_topology(mob_mol2, "MOB", 0):
+            if not mob_success:
                 raise RuntimeError("分子B拓扑生成失败")
 
             # 步骤7：文件整理
@@ -469,10 +740,12 @@ class GromacsProcessor:
             processing_time = end_time - start_time
 
             self.logger.info(f"样本 {sample_id} 处理完成，耗时：{processing_time:.2f}秒")
-            self.completed_samples.append(sample_id)
-            self.stats['completed'] += 1
 
-            return True
+            return {
+                'Sample': sample_id,
+                'Success': True,
+                'Time': processing_time
+            }
 
         except Exception as e:
             end_time = time.time()
@@ -480,15 +753,27 @@ class GromacsProcessor:
 
             self.logger.error(f"样本 {sample_id} 处理失败：{e}")
             self.logger.error(f"处理耗时：{processing_time:.2f}秒")
-            self.failed_samples.append({
+
+            return {
                 'Sample': sample_id,
+                'Success': False,
                 'Error': str(e),
                 'Time': processing_time
+            }
+
+    def record_result(self, result):
+        """在主进程中汇总单个样本的处理结果"""
+        if result['Success']:
+            self.completed_samples.append(result['Sample'])
+            self.stats['completed'] += 1
+        else:
+            self.failed_samples.append({
+                'Sample': result['Sample'],
+                'Error': result['Error'],
+                'Time': result['Time']
             })
             self.stats['failed'] += 1
 
-            return False
-
     def generate_report(self):
         """生成处理报告"""
         self.logger.info("生成处理报告...")
@@ -496,35 +781,37 @@ class GromacsProcessor:
         report_file = self.log_dir / f"processing_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
 
         try:
-            with open(report_file, 'w', encoding='utf-8') as f:
-                f.write("=== GROMACS模拟文件处理报告 ===\n")
-                f.write(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"\n")
-
-                f.write("=== 统计信息 ===\n")
-                f.write(f"总样本数：{self.stats['total']}\n")
-                f.write(f"成功处理：{self.stats['completed']}\n")
-                f.write(f"处理失败：{self.stats['failed']}\n")
-                f.write(f"跳过样本：{self.stats['skipped']}\n")
-                f.write(f"成功率：{(self.stats['completed'] / self.stats['total'] * 100):.1f}%\n")
-                f.write(f"\n")
-
-                if self.completed_samples:
-                    f.write("=== 成功处理的样本 ===\n")
-                    for sample in self.completed_samples:
-                        f.write(f"[成功] 样本 {sample}\n")
-                    f.write(f"\n")
-
-                if self.failed_samples:
-                    f.write("=== 处理失败的样本 ===\n")
-                    for failed in self.failed_samples:
-                        f.write(f"[失败] 样本 {failed['Sample']}: {failed['Error']}\n")
-                    f.write(f"\n")
-
-                f.write("=== 日志文件 ===\n")
-                log_files = list(self.log_dir.glob("gromacs_processor_*.log"))
-                for log_file in sorted(log_files):
-                    f.write(f"{log_file}\n")
+            # 先在内存中拼接完整报告，再一次性写入
+            parts = []
+            parts.append("=== GROMACS模拟文件处理报告 ===\n")
+            parts.append(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            parts.append("\n")
+
+            parts.append("=== 统计信息 ===\n")
+            parts.append(f"总样本数：{self.stats['total']}\n")
+            parts.append(f"成功处理：{self.stats['completed']}\n")
+            parts.append(f"处理失败：{self.stats['failed']}\n")
+            parts.append(f"跳过样本：{self.stats['skipped']}\n")
+            parts.append(f"成功率：{(self.stats['completed'] / self.stats['total'] * 100):.1f}%\n")
+            parts.append("\n")
+
+            if self.completed_samples:
+                parts.append("=== 成功处理的样本 ===\n")
+                for sample in self.completed_samples:
+                    parts.append(f"[成功] 样本 {sample}\n")
+                parts.append("\n")
+
+            if self.failed_samples:
+                parts.append("=== 处理失败的样本 ===\n")
+                for failed in self.failed_samples:
+                    parts.append(f"[失败] 样本 {failed['Sample']}: {failed['Error']}\n")
+                parts.append("\n")
+
+            parts.append("=== 日志文件 ===\n")
+            for log_file in sorted(self.log_dir.glob("gromacs_processor_*.log")):
+                parts.append(f"{log_file}\n")
+
+            report_file.write_text("".join(parts), encoding='utf-8')
 
             self.logger.info(f"处理报告已生成：{report_file}")
 
@@ -554,24 +841,58 @@ class GromacsProcessor:
                 self.logger.info("所有样本已完成，无需处理")
                 return True
 
-            self.logger.info(f"开始处理 {len(samples_to_process)} 个样本")
+            # 并发预下载所有分子结构
+            self.prefetch_structures(samples_to_process)
 
-            # 创建进度条
-            with tqdm(
-                total=len(samples_to_process),
-                desc="处理进度",
-                unit="sample"
-            ) as progress_bar:
+            max_workers = min(self.max_workers, len(samples_to_process))
+            self.logger.info(f"开始处理 {len(samples_to_process)} 个样本（并行进程数：{max_workers}）")
 
-                # 处理每个样本
-                for sample_data in samples_to_process:
-                    success = self.process_single_sample(sample_data, progress_bar)
-                    progress_bar.update(1)
+            # 子进程日志经队列汇总到主进程，由同一组处理器串行写入
+            log_queue = multiprocessing.Queue()
+            log_listener = QueueListener(log_queue, *self.log_handlers, respect_handler_level=True)
+            log_listener.start()
 
-                    if success:
-                        progress_bar.set_postfix({"状态": "成功"})
-                    else:
-                        progress_bar.set_postfix({"状态": "失败"})
+            try:
+                # 创建进度条
+                with tqdm(
+                    total=len(samples_to_process),
+                    desc="处理进度",
+                    unit="sample"
+                ) as progress_bar, ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=init_worker,
+                    initargs=(self, log_queue, self.log_level)
+                ) as executor:
+
+                    # 并行处理各样本
+                    futures = {
+                        executor.submit(process_sample_worker, sample_data): sample_data
+                        for sample_data in samples_to_process
+                    }
+
+                    for future in as_completed(futures):
+                        sample_id = futures[future]['Sample']
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # 工作进程异常退出等情况
+                            result = {
+                                'Sample': sample_id,
+                                'Success': False,
+                                'Error': f"工作进程异常：{e}",
+                                'Time': 0.0
+                            }
+                            self.logger.error(f"样本 {sample_id} 处理失败：{result['Error']}")
+
+                        self.record_result(result)
+                        progress_bar.update(1)
+
+                        if result['Success']:
+                            progress_bar.set_postfix({"状态": "成功"})
+                        else:
+                            progress_bar.set_postfix({"状态": "失败"})
+            finally:
+                log_listener.stop()
 
             # 生成报告
             self.generate_report()
@@ -590,6 +911,33 @@ class GromacsProcessor:
             self.logger.error(f"处理流程出现错误：{e}")
             return False
 
+        finally:
+            # 把缓存的日志写入文件
+            for handler in self.log_handlers:
+                handler.flush()
+
+
+# 工作进程内的处理器实例（由 init_worker 设置）
+_worker_processor = None
+
+
+def init_worker(processor, log_queue, log_level):
+    """工作进程初始化：日志改为写入队列，保存处理器实例"""
+    global _worker_processor
+
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(log_level)
+
+    _worker_processor = processor
+
+
+def process_sample_worker(sample_data):
+    """在工作进程中处理单个样本（模块级函数，可被pickle）"""
+    return _worker_processor.process_single_sample(sample_data)
+
 
 def main():
     """主函数"""
@@ -601,6 +949,8 @@ def main():
     parser.add_argument('--log-level', default='INFO',
                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                        help='日志级别')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='并行处理的进程数（默认为CPU核心数的一半）')
 
     args = parser.parse_args()
 
@@ -608,7 +958,8 @@ def main():
         processor = GromacsProcessor(
             mol_csv_path=args.csv,
             file_dir=args.file_dir,
-            log_level=getattr(logging, args.log_level)
+            log_level=getattr(logging, args.log_level),
+            max_workers=args.workers
         )
 
         success = processor.run()
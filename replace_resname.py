@@ -1,48 +1,98 @@
 #! / usr / bin / python3
 import os
+import re
+import mmap
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# MOL2 ATOM 记录中的字段（连续非空白字符）
+FIELD_PATTERN = re.compile(rb'\S+')
+ATOM_SECTION = b"@<TRIPOS>ATOM"
+SECTION_PREFIX = b"@<TRIPOS>"
+
+def find_resname_fields(mm):
+    """定位所有 ATOM 段中第8列残基名的 (start, end) 字节位置"""
+    fields = []
+    pos = mm.find(ATOM_SECTION)
+    while pos != -1:
+        line_start = mm.find(b"\n", pos) + 1
+        if line_start == 0:
+            break
+
+        section_end = mm.find(SECTION_PREFIX, line_start)
+        if section_end == -1:
+            section_end = len(mm)
+
+        while line_start < section_end:
+            line_end = mm.find(b"\n", line_start, section_end)
+            if line_end == -1:
+                line_end = section_end
+
+            matches = list(islice(FIELD_PATTERN.finditer(mm[line_start:line_end]), 9))
+            if len(matches) >= 9:
+                start, end = matches[7].span()
+                fields.append((line_start + start, line_start + end))
+
+            line_start = line_end + 1
+
+        pos = mm.find(ATOM_SECTION, section_end)
+
+    return fields
 
 def replace_resname_in_mol2_inplace(file_path):
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
-
-    lines_out = []
-    in_atom_section = False
-    with open(file_path, 'r') as f_in:
-        for line in f_in:
-            stripped = line.strip()
-            if stripped == "@<TRIPOS>ATOM":
-                in_atom_section = True
-                lines_out.append(line)
-                continue
-            if stripped.startswith("@<TRIPOS>") and stripped != "@<TRIPOS>ATOM":
-                in_atom_section = False
-                lines_out.append(line)
-                continue
-
-            if in_atom_section:
-                parts = line.rstrip('\n').split()
-                if len(parts) >= 9:
-                    parts[-2] = base_name  # 替换残基名为文件名
-                    line = "  ".join(parts) + "\n"
-                lines_out.append(line)
-            else:
-                lines_out.append(line)
-
-    with open(file_path, 'w') as f_out:
-        f_out.writelines(lines_out)
-
-    print(f"[成功] 修改完成：{file_path} （残基名改为 {base_name}）")
+    base_name = sys.intern(os.path.splitext(os.path.basename(file_path))[0])
+    new_name = base_name.encode()
+    tmp_path = None
+
+    with open(file_path, 'r+b') as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0) as mm:
+                fields = find_resname_fields(mm)
+
+                if all(len(new_name) <= end - start for start, end in fields):
+                    # 新残基名不超过原列宽：直接在映射中原地改写，其余字节保持不变
+                    for start, end in fields:
+                        mm[start:end] = new_name.ljust(end - start)
+                    mm.flush()
+                else:
+                    # 新残基名更长：按段流式写入临时文件后替换原文件
+                    tmp_path = f"{file_path}.tmp"
+                    with open(tmp_path, 'wb') as f_out:
+                        prev = 0
+                        for start, end in fields:
+                            f_out.write(mm[prev:start])
+                            f_out.write(new_name.ljust(end - start))
+                            prev = end
+                        f_out.write(mm[prev:])
+
+    if tmp_path:
+        os.replace(tmp_path, file_path)
+
+    return base_name
+
+def modify_mol2_file(file_path):
+    """处理单个 mol2 文件，成功返回 True"""
+    try:
+        base_name = replace_resname_in_mol2_inplace(file_path)
+        print(f"[成功] 修改完成：{file_path} （残基名改为 {base_name}）")
+        return True
+    except Exception as e:
+        print(f"[!] 处理失败：{file_path}，原因：{e}")
+        return False
 
 def recursive_modify_all_mol2_files(root_dir="."):
-    mol2_count = 0
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            if filename.lower().endswith(".mol2"):
-                file_path = os.path.join(dirpath, filename)
-                try:
-                    replace_resname_in_mol2_inplace(file_path)
-                    mol2_count += 1
-                except Exception as e:
-                    print(f"[!] 处理失败：{file_path}，原因：{e}")
+    file_paths = [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(root_dir)
+        for filename in filenames
+        if filename.lower().endswith(".mol2")
+    ]
+
+    # 各文件相互独立，使用线程池并行改写
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        mol2_count = sum(executor.map(modify_mol2_file, file_paths))
 
     if mol2_count == 0:
         print("警告：没有找到任何 .mol2 文件。")